@@ -0,0 +1,12 @@
+"""
+Database helpers shared by the ingest script and the API.
+"""
+
+
+def to_libpq_url(url: str):
+    """
+    Strips the SQLAlchemy driver suffix (e.g. postgresql+psycopg://) so the
+    same connection string can be passed straight to psycopg or asyncpg.
+    """
+    scheme, rest = url.split("://", 1)
+    return f"postgresql://{rest}" if scheme.startswith("postgresql") else url
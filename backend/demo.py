@@ -1,9 +1,16 @@
 import os
+import uuid
+import numpy as np
+import psycopg
 from dotenv import load_dotenv
+from pgvector.psycopg import register_vector
+from psycopg.types.json import Jsonb
 
 from langchain_postgres import PGVector
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from semantic_text_splitter import TextSplitter
+from db import to_libpq_url
+from onnx_embeddings import ONNXEmbeddings
+from policy_tags import category_mask
 
 
 load_dotenv()
@@ -12,6 +19,10 @@ load_dotenv()
 DB_CONNECTION = os.getenv("PG_CONN")
 COLLECTION_NAME = "documents"
 DOCUMENT_PATH = "knowledge_base.txt"
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "onnx_mini_int8")
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+HNSW_INDEX = "ix_langchain_pg_embedding_hnsw"
+
 
 # -------------------------
 # Load document
@@ -23,32 +34,80 @@ with open(DOCUMENT_PATH, "r", encoding="utf-8") as f:
 # -------------------------
 # Chunking
 # -------------------------
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=80
-)
+# Character-based, like the old RecursiveCharacterTextSplitter settings,
+# but the splitting runs in Rust
+text_splitter = TextSplitter(500, overlap=80)
 
-chunks = text_splitter.split_text(raw_text)
+chunks = text_splitter.chunks(raw_text)
 
 print(f"Total chunks created: {len(chunks)}")
 
 # -------------------------
 # Embeddings
 # -------------------------
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+embeddings = ONNXEmbeddings(EMBEDDING_MODEL_DIR, batch_size=64)
+
+# Encode in length order so each batch pads to similar-sized chunks,
+# then put the vectors back in chunk order
+order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+sorted_vectors = embeddings.embed_documents([chunks[i] for i in order])
+
+vectors = [None] * len(chunks)
+for position, index in enumerate(order):
+    vectors[index] = sorted_vectors[position]
 
 # -------------------------
 # Store in pgvector
 # -------------------------
+# PGVector creates the tables and the collection row; rows are loaded below
 vectorstore = PGVector(
     embeddings,
     connection=DB_CONNECTION,
     collection_name=COLLECTION_NAME,
+    embedding_length=EMBEDDING_DIM,
     pre_delete_collection=True  # clears old data
 )
 
-vectorstore.add_texts(chunks)
+# Load every chunk with a single binary COPY in one transaction
+# instead of one INSERT per row. Each chunk carries its policy category
+# bitmask so the API never has to scan chunk text.
+with psycopg.connect(to_libpq_url(DB_CONNECTION)) as conn:
+    register_vector(conn)
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT uuid FROM langchain_pg_collection WHERE name = %s",
+            (COLLECTION_NAME,)
+        )
+        collection_id = cur.fetchone()[0]
+
+        # HNSW needs a fixed dimension; drop the index so the load
+        # does not maintain it row by row
+        cur.execute(f"ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector({EMBEDDING_DIM})")
+        cur.execute(f"DROP INDEX IF EXISTS {HNSW_INDEX}")
+
+        with cur.copy(
+            "COPY langchain_pg_embedding (id, collection_id, embedding, document, cmetadata) "
+            "FROM STDIN (FORMAT BINARY)"
+        ) as copy:
+            copy.set_types(["varchar", "uuid", "vector", "varchar", "jsonb"])
+            for chunk, vector in zip(chunks, vectors):
+                copy.write_row((
+                    str(uuid.uuid4()),
+                    collection_id,
+                    np.asarray(vector, dtype=np.float32),
+                    chunk,
+                    Jsonb({"cat_mask": category_mask(chunk)}),
+                ))
+
+        # Rebuild the ANN index in one pass over the loaded rows
+        cur.execute(
+            f"CREATE INDEX {HNSW_INDEX} ON langchain_pg_embedding "
+            "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_collection_id "
+            "ON langchain_pg_embedding (collection_id)"
+        )
 
 print("Ingestion completed successfully.")
\ No newline at end of file
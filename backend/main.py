@@ -1,21 +1,33 @@
 import os
+import asyncio
+import logging
+import asyncpg
+import numpy as np
+import orjson
+from cachetools import Cache, LRUCache
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from langchain_postgres import PGVector
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from pgvector.asyncpg import register_vector
 from langchain_ollama import ChatOllama
-from langchain_core.prompts import PromptTemplate
-from langchain.agents import create_agent
+from db import to_libpq_url
+from onnx_embeddings import ONNXEmbeddings
+from policy_tags import category_mask, classify
+from langchain_core.messages import HumanMessage, SystemMessage
 
 load_dotenv()
 
+# Levels come from the uvicorn log config:
+#   uvicorn main:app --log-config log_config.json
+log = logging.getLogger("policybot")
+
 # -------------------------
 # App
 # -------------------------
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -31,35 +43,95 @@ app.add_middleware(
 # -------------------------
 DB_CONNECTION = os.getenv("PG_CONN")
 COLLECTION_NAME = "documents"
-SIMILARITY_THRESHOLD = 0.25  # Adjust for stricter/looser responses
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "onnx_mini_int8")
+SIMILARITY_THRESHOLD = 0.25  # Minimum cosine similarity; adjust for stricter/looser responses
+HNSW_EF_SEARCH = 40  # Higher improves recall at the cost of latency
+# num_ctx (1024) minus num_predict (256) leaves ~768 prompt tokens. System
+# prompts and template take ~150, the 3 retrieved chunks (<= 500 chars each)
+# ~400, which leaves room for a question of about 600 characters
+MAX_QUESTION_CHARS = 600
+CACHE_SIZE = 1024
+CACHE_SIMILARITY = 0.95  # Cosine similarity needed to reuse a cached answer
+
+GREETINGS = frozenset({"hi", "hello", "hey", "good morning", "good evening"})
+
+# Fixed replies are serialized once and sent as-is
+GREETING_BODY = orjson.dumps({"response": "Hello! How can I assist you with IT Helpdesk related queries?"})
+REJECT_BODY = orjson.dumps({"response": "I can only help with IT Helpdesk related questions."})
+TOO_LONG_BODY = orjson.dumps({"response": f"Please keep your question under {MAX_QUESTION_CHARS} characters."})
+
+
+# Reads only the columns the endpoint uses; the score is cosine similarity
+# (1 - cosine distance), so higher means a closer match
+SEARCH_SQL = """
+    SELECT document,
+           (cmetadata->>'cat_mask')::int AS cat_mask,
+           1 - (embedding <=> $1) AS score
+    FROM langchain_pg_embedding
+    WHERE collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = $2)
+    ORDER BY embedding <=> $1
+    LIMIT 3
+"""
 
 # -------------------------
 # Embeddings
 # -------------------------
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+embeddings = None
+pool = None
+
+
+async def load_embeddings():
+    """
+    Loads the embedding model and opens the database pool once the server
+    starts, running a warm-up encode so the first request does not pay for
+    model initialization.
+    """
+    global embeddings, pool
+
+    embeddings = ONNXEmbeddings(EMBEDDING_MODEL_DIR)
+    embeddings.embed_query("warmup")
+
+    # Every pooled connection starts with the HNSW search width already set
+    pool = await asyncpg.create_pool(
+        to_libpq_url(DB_CONNECTION),
+        min_size=4,
+        max_size=16,
+        init=register_vector,
+        server_settings={"hnsw.ef_search": str(HNSW_EF_SEARCH)},
+    )
+
+
+async def close_pool():
+    if pool is not None:
+        await pool.close()
 
-vectorstore = PGVector(
-    embeddings,
-    connection=DB_CONNECTION,
-    collection_name=COLLECTION_NAME,
-)
+
+app.add_event_handler("startup", load_embeddings)
+app.add_event_handler("shutdown", close_pool)
 
 # -------------------------
 # LLM
 # -------------------------
+# Run Ollama with OLLAMA_NUM_PARALLEL=4 (or higher) and OLLAMA_MAX_LOADED_MODELS=1,
+# otherwise concurrent requests are queued behind a single generation slot.
 llm = ChatOllama(
     model="policybot",
-    temperature=0.2
+    temperature=0.2,
+    num_ctx=1024,
+    num_predict=256,
+    num_thread=os.cpu_count()
+)
+
+SYSTEM_MESSAGE = SystemMessage(
+    content="You are an internal chatbot for the company. Please answer questions in natural language."
 )
 
 # -------------------------
 # Prompt (STRICT)
 # -------------------------
-prompt = PromptTemplate(
-    input_variables=["context", "question"],
-    template="""
+def render_prompt(context: str, question: str):
+    # Static template, so a plain f-string instead of PromptTemplate.format
+    return f"""
         Use the following context to answer the user question.
 
         Context:
@@ -70,11 +142,10 @@ prompt = PromptTemplate(
 
         Answer:
     """
-)
 
 
 def map_confidence(avg_score: float):
-    print(avg_score)
+    log.debug("avg_score=%.3f", avg_score)
     if avg_score > 0.65:
         return "High"
     elif avg_score > 0.50:
@@ -83,156 +154,53 @@ def map_confidence(avg_score: float):
         return "Low"
 
 
-def generate_followups(context: str):
+# -------------------------
+# Semantic cache
+# -------------------------
+class SemanticCache:
+    """
+    Keeps answers for recent questions keyed by their query embedding.
+    A new question whose embedding is close enough to a cached one gets
+    the cached answer back without touching the vector store or the LLM.
     """
-    Extracts high-level IT policy explanation categories from document chunks. 
-    Identifies which policy areas are relevant based on keywords in the provided text.
 
-    Args:
-        chunks (list[str]): List of text chunks retrieved as relevant context.
+    def __init__(self, maxsize: int, threshold: float):
+        self.entries = LRUCache(maxsize=maxsize)
+        self.threshold = threshold
+        self.keys = []
+        self.matrix = None
 
-    Returns:
-        list[str]: Unique list of human-readable policy explanation labels.
-    """
-    followups = set()
-    t = context.lower()
-
-    # Identity & Access
-    if any(k in t for k in ["password", "authentication", "mfa", "identity"]):
-        followups.update([
-            "How do I reset my password?",
-            "What are the password security requirements?",
-            "Is multi-factor authentication mandatory?"
-        ])
-
-    # Privileged access
-    if any(k in t for k in ["privileged", "admin", "elevated access"]):
-        followups.update([
-            "Are admin accounts subject to additional controls?",
-            "Who approves privileged access?"
-        ])
-
-    # Software
-    if any(k in t for k in ["software", "application", "license", "installation"]):
-        followups.update([
-            "How do I request new software?",
-            "Can I install software without IT approval?",
-            "What happens if unlicensed software is installed?"
-        ])
-
-    # Hardware & devices
-    if any(k in t for k in ["hardware", "device", "laptop", "endpoint"]):
-        followups.update([
-            "Can I use my personal device for work?",
-            "How are company devices managed?",
-            "What should I do if my laptop is lost?"
-        ])
-
-    # Network & VPN
-    if any(k in t for k in ["vpn", "network", "wi-fi", "remote access"]):
-        followups.update([
-            "How do I access VPN?",
-            "Can I bypass VPN on trusted networks?",
-            "Who do I contact for network issues?"
-        ])
-
-    # Security & incidents
-    if any(k in t for k in ["security", "incident", "breach", "malware"]):
-        followups.update([
-            "How do I report a security incident?",
-            "What happens after an incident is reported?",
-            "How are incidents prioritized?"
-        ])
-
-    # Data protection
-    if any(k in t for k in ["data", "encryption", "classification", "storage"]):
-        followups.update([
-            "How is company data classified?",
-            "Where can sensitive data be stored?",
-            "Is encryption required for all data?"
-        ])
-
-    # Onboarding / Offboarding
-    if any(k in t for k in ["onboarding", "offboarding", "termination", "resignation"]):
-        followups.update([
-            "What happens to system access when an employee leaves?",
-            "How is access revoked after resignation?"
-        ])
-
-    # Fallback (first-time / generic)
-    if not followups:
-        followups.update([
-            "What services does the IT Helpdesk provide?",
-            "How can I contact IT support?",
-            "What issues are not supported by IT?"
-        ])
-
-    return list(followups)[:3]
-
-
-
-def extract_explanations(chunks: list[str]):
-    explanations = set()
-
-    for text in chunks:
-        t = text.lower()
-
-        # Identity & Access
-        if any(k in t for k in ["password", "authentication", "mfa", "identity"]):
-            explanations.add("IT Policy → Identity & Access Management")
-
-        # Privileged access
-        if any(k in t for k in ["privileged", "admin", "elevated access"]):
-            explanations.add("IT Policy → Privileged Access Control")
-
-        # Software
-        if any(k in t for k in ["software", "application", "license", "installation"]):
-            explanations.add("IT Policy → Software Installation & Licensing")
-
-        # Hardware & devices
-        if any(k in t for k in ["hardware", "device", "laptop", "endpoint"]):
-            explanations.add("IT Policy → Hardware & Device Management")
-
-        # Network & VPN
-        if any(k in t for k in ["vpn", "network", "wi-fi", "remote access"]):
-            explanations.add("IT Policy → Network & Remote Access")
-
-        # Email & collaboration
-        if any(k in t for k in ["email", "messaging", "collaboration"]):
-            explanations.add("IT Policy → Email & Collaboration Tools")
-
-        # Data protection
-        if any(k in t for k in ["data", "encryption", "classification", "storage"]):
-            explanations.add("IT Policy → Data Protection & Handling")
-
-        # Security & incidents
-        if any(k in t for k in ["security", "incident", "breach", "malware"]):
-            explanations.add("IT Policy → Security & Incident Management")
-
-        # Change & operations
-        if any(k in t for k in ["change management", "patch", "maintenance"]):
-            explanations.add("IT Policy → Change & Operations Management")
-
-        # Compliance & audit
-        if any(k in t for k in ["audit", "compliance", "monitoring", "logging"]):
-            explanations.add("IT Policy → Compliance & Audit")
+    def _rebuild(self):
+        self.keys = list(self.entries.keys())
+        # Read through the base Cache so the rebuild does not count as a use
+        self.matrix = np.stack([Cache.__getitem__(self.entries, k)[0] for k in self.keys])
+
+    def lookup(self, query: np.ndarray):
+        if not self.entries:
+            return None
+        if self.matrix is None:
+            self._rebuild()
 
-        # Acceptable use
-        if any(k in t for k in ["acceptable use", "personal use", "misuse"]):
-            explanations.add("IT Policy → Acceptable Use")
+        sims = self.matrix @ query
+        best = int(sims.argmax())
+        if sims[best] <= self.threshold:
+            return None
 
-        # Onboarding / Offboarding
-        if any(k in t for k in ["onboarding", "offboarding", "termination", "resignation"]):
-            explanations.add("IT Policy → User Lifecycle Management")
+        # Touch the entry so the LRU order reflects the hit
+        return self.entries[self.keys[best]][1]
 
-        # Exceptions & enforcement
-        if any(k in t for k in ["exception", "violation", "disciplinary", "enforcement"]):
-            explanations.add("IT Policy → Policy Enforcement & Exceptions")
+    def insert(self, key: str, query: np.ndarray, response: dict):
+        self.entries[key] = (query, response)
+        self.matrix = None
 
-    return list(explanations)
 
+def normalize(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    return v / np.linalg.norm(v)
 
 
+response_cache = SemanticCache(CACHE_SIZE, CACHE_SIMILARITY)
+
 
 # -------------------------
 # Request Model
@@ -241,79 +209,209 @@ class ChatRequest(BaseModel):
     message: str
 
 # -------------------------
-# Chat Endpoint
+# Chat Pipeline
 # -------------------------
-@app.post("/chat")
-async def chat(req: ChatRequest):
+async def prepare(req: ChatRequest):
+    """
+    Runs everything that comes before generation for a chat request.
+
+    Returns:
+        tuple: A ready response (greeting, cache hit or rejection) and None,
+        or None and the (cache_key, query_vector, context, cat_mask, avg_score)
+        needed to generate an answer.
+    """
     user_input = req.message.strip().lower()
 
+    # ---- Length limit, so the prompt always fits in num_ctx
+    if len(req.message) > MAX_QUESTION_CHARS:
+        return Response(TOO_LONG_BODY, media_type="application/json"), None
+
     # ---- Greeting short-circuit
-    if user_input in {"hi", "hello", "hey", "good morning", "good evening"}:
-        return {"response": "Hello! How can I assist you with IT Helpdesk related queries?"}
+    if user_input in GREETINGS:
+        return Response(GREETING_BODY, media_type="application/json"), None
+
+    # ---- Semantic cache
+    query_vector = normalize(await embeddings.aembed_query(req.message))
+
+    cached = response_cache.lookup(query_vector)
+    if cached is not None:
+        return cached, None
+
+    # ---- Similarity search WITH scores
+    results = await pool.fetch(SEARCH_SQL, query_vector, COLLECTION_NAME)
+
+    # ---- Hard rejection if nothing relevant
+    if not results:
+        return Response(REJECT_BODY, media_type="application/json"), None
+
+    # ---- Score filtering
+    scores = np.fromiter((row["score"] for row in results), dtype=np.float32, count=len(results))
+    keep = scores > SIMILARITY_THRESHOLD
+
+    if not keep.any():
+        return Response(REJECT_BODY, media_type="application/json"), None
+
+    avg_score = float(scores[keep].mean())
+
+    relevant = [results[i] for i in np.flatnonzero(keep)]
+    relevant_docs = [row["document"] for row in relevant]
+
+    # ---- Policy categories, tagged per chunk at ingest
+    cat_mask = 0
+    for row in relevant:
+        chunk_mask = row["cat_mask"]
+        if chunk_mask is None:  # ingested before tagging existed
+            chunk_mask = category_mask(row["document"])
+        cat_mask |= chunk_mask
+
+    log.debug("relevant_docs=%r", relevant_docs)
+
+    if not relevant_docs:
+        return Response(REJECT_BODY, media_type="application/json"), None
+
+    context = "\n\n".join(relevant_docs)
+
+    return None, (user_input, query_vector, context, cat_mask, avg_score)
 
+
+def build_messages(context: str, question: str):
+    final_prompt = render_prompt(context, question)
+
+    return [
+        SYSTEM_MESSAGE,
+        HumanMessage(content=f"User Query: {final_prompt}")
+    ]
+
+
+def describe(cat_mask: int, avg_score: float):
+    """
+    Builds the metadata sent alongside an answer.
+    """
+    followups, explanations = classify(cat_mask)
+
+    return {
+        "followups": followups,
+        "confidence": map_confidence(avg_score),
+        "confidence_score": round(avg_score, 3),
+        "explanations": explanations
+    }
+
+
+def sse_event(payload: dict):
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+# -------------------------
+# Chat Endpoints
+# -------------------------
+# Work currently in flight, keyed by normalized question, so identical
+# questions arriving together share one run: full answers for /chat,
+# embedding + cache lookup + retrieval for /chat/stream
+inflight_answers = {}
+inflight_retrievals = {}
+
+# Result handed to waiters when the leading run was cancelled or failed;
+# they then do the work themselves
+RETRY = object()
+
+
+async def coalesce(inflight: dict, key: str, run):
+    """
+    Awaits run() once per key among concurrent callers; the others wait for
+    and share its result.
+    """
+    pending = inflight.get(key)
+    if pending is not None:
+        try:
+            result = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # Only propagate if this request itself was cancelled
+            if asyncio.current_task().cancelling():
+                raise
+            result = RETRY
+
+        if result is not RETRY:
+            return result
+        return await run()
+
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await run()
+    except BaseException:
+        future.set_result(RETRY)
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        inflight.pop(key, None)
+
+    return result
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest):
+    key = req.message.strip().lower()
+    return await coalesce(inflight_answers, key, lambda: answer(req))
+
+
+async def answer(req: ChatRequest):
     try:
-        # ---- Similarity search WITH scores
-        results = vectorstore.similarity_search_with_score(
-            req.message,
-            k=3
-        )
-
-        # ---- Hard rejection if nothing relevant
-        if not results:
-            return {"response": "I can only help with IT Helpdesk related questions."}
-
-        # ---- Score filtering
-        filtered = [(doc, score) for doc, score in results if score > SIMILARITY_THRESHOLD]
-
-        if not filtered:
-            return {"response": "I can only help with IT Helpdesk related questions."}
-
-        avg_score = sum(score for _, score in filtered) / len(filtered)
-        confidence = map_confidence(avg_score)
-
-        relevant_docs = [doc.page_content for doc, _ in filtered]
-
-        
-        print(relevant_docs)
-
-        if not relevant_docs:
-            return {"response": "I can only help with IT Helpdesk related questions."}
-
-        context = "\n\n".join(relevant_docs)
-
-        final_prompt = prompt.format(
-            context=context,
-            question=req.message
-        )
-
-        # ---- Create and invoke agent
-        agent = create_agent(
-            model=llm,
-            tools=[],
-            system_prompt="You are an internal chatbot for the company. Please answer questions in natural language."
-        )
-
-        response = agent.invoke({
-            "messages": [{"role": "user", "content": f"User Query: {final_prompt}"}]
-        })
-
-        # Return the message content
-        # return {"response": response["messages"][-1].content}
-        answer_text = response["messages"][-1].content
-        followups = generate_followups(context)
-        
-        explanations = extract_explanations(relevant_docs)
-
-        
-        return {
-            "response": answer_text,
-            "followups": followups,
-            "confidence": confidence,
-            "confidence_score": round(avg_score, 3),
-            "explanations": explanations
+        ready, pending = await prepare(req)
+        if ready is not None:
+            return ready
+
+        cache_key, query_vector, context, cat_mask, avg_score = pending
+
+        # ---- Invoke LLM (no tools, so no agent loop is needed)
+        response = await llm.ainvoke(build_messages(context, req.message))
+
+        result = {
+            "response": response.content,
+            **describe(cat_mask, avg_score)
         }
+        response_cache.insert(cache_key, query_vector, result)
 
+        return result
 
     except Exception as e:
         return {"response": f"Error processing your request: {str(e)}"}
 
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Same as /chat, but streams the generated answer as server-sent events:
+    one {"delta": ...} event per token chunk, then a final {"done": true, ...}
+    event carrying followups and confidence. Greetings, cache hits and
+    rejections are returned as plain JSON.
+    """
+    key = req.message.strip().lower()
+
+    try:
+        # Each client needs its own token stream, so only the work before
+        # generation is shared between identical concurrent questions
+        ready, pending = await coalesce(inflight_retrievals, key, lambda: prepare(req))
+        if ready is not None:
+            return ready
+    except Exception as e:
+        return {"response": f"Error processing your request: {str(e)}"}
+
+    cache_key, query_vector, context, cat_mask, avg_score = pending
+
+    async def events():
+        parts = []
+        try:
+            async for chunk in llm.astream(build_messages(context, req.message)):
+                parts.append(chunk.content)
+                yield sse_event({"delta": chunk.content})
+        except Exception as e:
+            yield sse_event({"error": f"Error processing your request: {str(e)}"})
+            return
+
+        details = describe(cat_mask, avg_score)
+        response_cache.insert(cache_key, query_vector, {"response": "".join(parts), **details})
+
+        yield sse_event({"done": True, **details})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,74 @@
+"""
+MiniLM sentence embeddings served through ONNX Runtime.
+
+The model is exported and quantized to int8 once, and the tokenizer files
+written by the export are copied next to the quantized model:
+
+    optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 \
+        --task feature-extraction onnx_mini/
+    optimum-cli onnxruntime quantize --avx512_vnni --onnx_model onnx_mini/ -o onnx_mini_int8/
+    cp onnx_mini/tokenizer.json onnx_mini/tokenizer_config.json \
+        onnx_mini/vocab.txt onnx_mini/special_tokens_map.json onnx_mini_int8/
+"""
+import os
+
+import numpy as np
+import onnxruntime as ort
+from langchain_core.embeddings import Embeddings
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from transformers import AutoTokenizer
+
+
+class ONNXEmbeddings(Embeddings):
+    """
+    LangChain embeddings backed by a quantized MiniLM ONNX model.
+    Produces the same mean-pooled, L2-normalized vectors as
+    sentence-transformers, without loading the PyTorch model.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        file_name: str = "model_quantized.onnx",
+        batch_size: int = 64,
+        max_length: int = 256,
+        provider: str = "CPUExecutionProvider",
+    ):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count()
+        options.inter_op_num_threads = 1
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=file_name,
+            provider=provider,
+            session_options=options,
+        )
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _encode(self, texts: list[str]):
+        inputs = self.tokenizer(
+            texts,
+            padding="longest",
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        hidden = self.model(**inputs).last_hidden_state
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.linalg.norm(pooled, axis=1, keepdims=True)
+
+    def embed_documents(self, texts: list[str]):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            vectors.extend(self._encode(batch).tolist())
+        return vectors
+
+    def embed_query(self, text: str):
+        return self._encode([text])[0].tolist()
@@ -0,0 +1,163 @@
+"""
+IT policy categories used to tag retrieved context.
+
+Chunks are tagged with a category bitmask once at ingest (demo.py) and the
+API unions the masks of the retrieved chunks to pick followups and
+explanation labels, so no text is scanned at request time.
+"""
+import ahocorasick
+
+
+(
+    IDENTITY,
+    PRIVILEGED,
+    SOFTWARE,
+    HARDWARE,
+    NETWORK,
+    EMAIL,
+    DATA,
+    SECURITY,
+    CHANGE,
+    COMPLIANCE,
+    ACCEPTABLE_USE,
+    LIFECYCLE,
+    ENFORCEMENT,
+) = range(13)
+
+CATEGORY_KEYWORDS = {
+    IDENTITY: ["password", "authentication", "mfa", "identity"],
+    PRIVILEGED: ["privileged", "admin", "elevated access"],
+    SOFTWARE: ["software", "application", "license", "installation"],
+    HARDWARE: ["hardware", "device", "laptop", "endpoint"],
+    NETWORK: ["vpn", "network", "wi-fi", "remote access"],
+    EMAIL: ["email", "messaging", "collaboration"],
+    DATA: ["data", "encryption", "classification", "storage"],
+    SECURITY: ["security", "incident", "breach", "malware"],
+    CHANGE: ["change management", "patch", "maintenance"],
+    COMPLIANCE: ["audit", "compliance", "monitoring", "logging"],
+    ACCEPTABLE_USE: ["acceptable use", "personal use", "misuse"],
+    LIFECYCLE: ["onboarding", "offboarding", "termination", "resignation"],
+    ENFORCEMENT: ["exception", "violation", "disciplinary", "enforcement"],
+}
+
+CATEGORY_FOLLOWUPS = {
+    IDENTITY: (
+        "How do I reset my password?",
+        "What are the password security requirements?",
+        "Is multi-factor authentication mandatory?",
+    ),
+    PRIVILEGED: (
+        "Are admin accounts subject to additional controls?",
+        "Who approves privileged access?",
+    ),
+    SOFTWARE: (
+        "How do I request new software?",
+        "Can I install software without IT approval?",
+        "What happens if unlicensed software is installed?",
+    ),
+    HARDWARE: (
+        "Can I use my personal device for work?",
+        "How are company devices managed?",
+        "What should I do if my laptop is lost?",
+    ),
+    NETWORK: (
+        "How do I access VPN?",
+        "Can I bypass VPN on trusted networks?",
+        "Who do I contact for network issues?",
+    ),
+    SECURITY: (
+        "How do I report a security incident?",
+        "What happens after an incident is reported?",
+        "How are incidents prioritized?",
+    ),
+    DATA: (
+        "How is company data classified?",
+        "Where can sensitive data be stored?",
+        "Is encryption required for all data?",
+    ),
+    LIFECYCLE: (
+        "What happens to system access when an employee leaves?",
+        "How is access revoked after resignation?",
+    ),
+}
+
+DEFAULT_FOLLOWUPS = (
+    "What services does the IT Helpdesk provide?",
+    "How can I contact IT support?",
+    "What issues are not supported by IT?",
+)
+
+CATEGORY_LABELS = {
+    IDENTITY: "IT Policy → Identity & Access Management",
+    PRIVILEGED: "IT Policy → Privileged Access Control",
+    SOFTWARE: "IT Policy → Software Installation & Licensing",
+    HARDWARE: "IT Policy → Hardware & Device Management",
+    NETWORK: "IT Policy → Network & Remote Access",
+    EMAIL: "IT Policy → Email & Collaboration Tools",
+    DATA: "IT Policy → Data Protection & Handling",
+    SECURITY: "IT Policy → Security & Incident Management",
+    CHANGE: "IT Policy → Change & Operations Management",
+    COMPLIANCE: "IT Policy → Compliance & Audit",
+    ACCEPTABLE_USE: "IT Policy → Acceptable Use",
+    LIFECYCLE: "IT Policy → User Lifecycle Management",
+    ENFORCEMENT: "IT Policy → Policy Enforcement & Exceptions",
+}
+
+
+def build_keyword_automaton():
+    """
+    Builds a single Aho-Corasick automaton over every category keyword, so
+    a text can be classified in one linear pass instead of one substring
+    search per keyword.
+    """
+    automaton = ahocorasick.Automaton()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, category)
+    automaton.make_automaton()
+    return automaton
+
+
+keyword_automaton = build_keyword_automaton()
+
+
+def category_mask(text: str):
+    """
+    Tags a text with the policy categories its keywords mention.
+
+    Args:
+        text (str): Raw text; it is lowercased here.
+
+    Returns:
+        int: Bitmask with bit ``1 << category`` set for every matched category.
+    """
+    mask = 0
+    for _, category in keyword_automaton.iter(text.lower()):
+        mask |= 1 << category
+    return mask
+
+
+def classify(mask: int):
+    """
+    Maps a category bitmask to follow-up questions and explanation labels.
+
+    Args:
+        mask (int): Union of the category masks of the retrieved chunks.
+
+    Returns:
+        tuple[list[str], list[str]]: Up to three follow-up questions and the
+        unique human-readable policy explanation labels.
+    """
+    categories = [category for category in CATEGORY_LABELS if mask >> category & 1]
+
+    followups = set()
+    for category in categories:
+        followups.update(CATEGORY_FOLLOWUPS.get(category, ()))
+
+    # Fallback (first-time / generic)
+    if not followups:
+        followups.update(DEFAULT_FOLLOWUPS)
+
+    explanations = [CATEGORY_LABELS[category] for category in categories]
+
+    return list(followups)[:3], explanations
@@ -1,5 +1,4 @@
 import React, { useState, useEffect } from 'react';
-import axios from 'axios';
 import './App.css';
 
 
@@ -56,15 +55,19 @@ function App() {
 
 
     try {
-      const response = await axios.post("http://localhost:8000/chat", {
-        message: text,
+      const response = await fetch("http://localhost:8000/chat/stream", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ message: text }),
       });
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
       const emptyBotMessage = {
         user: text,
         bot: "",
         followups: [],
-        confidence: response.data.confidence,
-        explanations: response.data.explanations || []
+        confidence: null,
+        explanations: []
       };
 
       setChatHistory((prev) => [
@@ -75,17 +78,68 @@ function App() {
         emptyBotMessage
       ]);
 
-      typeText(response.data.response, (partialText) => {
+      const updateLastMessage = (changes) => {
         setChatHistory((prev) => {
           const updated = [...prev];
           updated[updated.length - 1] = {
             ...updated[updated.length - 1],
-            bot: partialText,
-            followups: response.data.followups || []
+            ...changes
           };
           return updated;
         });
-      });
+      };
+
+      // Greetings, cached answers and rejections come back as plain JSON
+      if (!(response.headers.get("content-type") || "").includes("text/event-stream")) {
+        const data = await response.json();
+        updateLastMessage({
+          confidence: data.confidence,
+          explanations: data.explanations || []
+        });
+        typeText(data.response, (partialText) => {
+          updateLastMessage({
+            bot: partialText,
+            followups: data.followups || []
+          });
+        });
+        return;
+      }
+
+      // Generated answers stream in as server-sent events
+      clearTimeout(typingTimerRef.current);
+      setLoading(false);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let answer = "";
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+
+        for (const event of events) {
+          if (!event.startsWith("data: ")) continue;
+          const payload = JSON.parse(event.slice("data: ".length));
+
+          if (payload.delta) {
+            answer += payload.delta;
+            updateLastMessage({ bot: answer });
+          } else if (payload.error) {
+            updateLastMessage({ bot: payload.error });
+          } else if (payload.done) {
+            updateLastMessage({
+              followups: payload.followups || [],
+              confidence: payload.confidence,
+              explanations: payload.explanations || []
+            });
+          }
+        }
+      }
     } catch (error) {
       setChatHistory((prev) => [
         ...prev,